@@ -2,6 +2,8 @@
 # encoding: utf-8
 import os
 import sys
+import threading
+from pathlib import Path
 
 import pytest
 
@@ -31,10 +33,19 @@ CONVERSIONS = [
         "function": M.name_to_id,
         "cases": [{"in": {"args": ["ICAT-G:2H(8)"]}, "out": ["9"]}],  #
     },
+    {
+        "function": M.prefix_to_names,
+        "cases": [
+            {"in": {"args": ["ICAT-G"]}, "out": ["ICAT-G", "ICAT-G:2H(8)"]},
+            {"in": {"args": ["Yadailation"]}, "out": []},
+        ],
+    },
     {
         "function": M.id_to_mass,
         "cases": [
             {"in": {"args": ["9"]}, "out": [494.30142]},
+            {"in": {"args": [9]}, "out": [494.30142]},
+            {"in": {"args": ["987654321"]}, "out": []},
         ],
     },
     {
@@ -109,3 +120,55 @@ def test_conversion_using_query(conversion):
         )
         print(converted, type(converted))
         assert case["out"] == converted
+
+
+def test_df_records_are_cached(tmp_path):
+    xml_file = tmp_path / "usermod.xml"
+    xml_file.write_text(
+        Path(__file__).parent.joinpath("usermod.xml").read_text(encoding="utf-8"),
+        encoding="utf-8",
+    )
+    um = unimod_mapper.UnimodMapper(xml_file_list=[xml_file], add_default_files=False)
+    signature = um._xml_signature(um.unimod_xml_names)
+    assert um._load_cache("df", signature) is None
+    um.df
+    assert um._load_cache("df", signature) is not None
+    # changing the file invalidates the cache
+    with open(xml_file, "a") as f:
+        f.write("\n")
+    assert um._load_cache("df", um._xml_signature(um.unimod_xml_names)) is None
+
+
+def test_failed_cache_write_leaves_no_tmp_file(cache_dir):
+    um = unimod_mapper.UnimodMapper()
+    # locks can not be pickled
+    um._dump_cache("df", (), [threading.Lock()])
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_sparse_accessions_are_looked_up(tmp_path):
+    xml = Path(__file__).parent.joinpath("usermod.xml").read_text(encoding="utf-8")
+    xml = xml.replace(
+        'title="SILAC K+6 TMT"', 'title="SILAC K+6 TMT" record_id="987654321"'
+    )
+    xml = xml.replace('title="SILAC K+8 TMT"', 'title="SILAC K+8 TMT" record_id="²"')
+    xml_file = tmp_path / "usermod.xml"
+    xml_file.write_text(xml, encoding="utf-8")
+    um = unimod_mapper.UnimodMapper(xml_file_list=[xml_file], add_default_files=False)
+    assert um.id_to_name("987654321") == ["SILAC K+6 TMT"]
+    assert um.id_to_name(987654321) == ["SILAC K+6 TMT"]
+    assert um.id_to_name("²") == ["SILAC K+8 TMT"]
+    # the position table is not sized by the largest accession
+    assert len(um._id_table) < 100
+
+
+def test_cache_keeps_the_newest_pickles(cache_dir, monkeypatch):
+    monkeypatch.setattr(unimod_mapper.unimod_mapper, "cache_size", 2)
+    um = unimod_mapper.UnimodMapper()
+    for mtime, kind in enumerate(["older", "newer"], 1):
+        um._dump_cache(kind, (), [])
+        os.utime(um._cache_path(kind, ()), (mtime, mtime))
+    um._dump_cache("newest", (), [])
+    assert sorted(cache_dir.iterdir()) == sorted(
+        [um._cache_path("newer", ()), um._cache_path("newest", ())]
+    )
@@ -161,7 +161,24 @@ CONVERSIONS = [
                     "1167",
                     "1922",
                 ],
-            }  #
+            },  #
+            {
+                "in": {"args": [18.2], "kwargs": {"decimal_places": 0}},
+                "out": [
+                    "127",
+                    "329",
+                    "608",
+                    "1079",
+                    "1167",
+                    "1922",
+                    "127",
+                    "329",
+                    "608",
+                    "1079",
+                    "1167",
+                    "1922",
+                ],
+            },
         ],
     },
     {
@@ -225,6 +242,33 @@ CONVERSIONS = [
                     "Gly->Asn",
                     "Gly",
                 ],
+            },
+            {
+                "in": {"args": [{"C": 2, "H": 3, "N": 1, "O": 1}]},
+                "out": [
+                    "Carbamidomethyl",
+                    "Carbofuran",
+                    "Ala->Gln",
+                    "Gly->Asn",
+                    "Gly",
+                    "Carbamidomethyl",
+                    "Carbofuran",
+                    "Ala->Gln",
+                    "Gly->Asn",
+                    "Gly",
+                ],
+            },
+        ],
+    },
+    {
+        "function": M.name2neutral_loss_list,
+        "cases": [
+            {
+                "in": {"args": ["Phospho"]},
+                "out": [
+                    [("T", 97.976896), ("S", 97.976896)],
+                    [("T", 97.976896), ("S", 97.976896)],
+                ],
             }
         ],
     },
@@ -246,7 +290,11 @@ CONVERSIONS = [
     {
         "function": M.composition2mass,
         "cases": [
-            {"in": {"args": ["C(22)H(30)2H(8)N(4)O(6)S(1)"]}, "out": 494.30142}  #
+            {"in": {"args": ["C(22)H(30)2H(8)N(4)O(6)S(1)"]}, "out": 494.30142},  #
+            {
+                "in": {"args": [{"C": 22, "H": 30, "2H": 8, "N": 4, "O": 6, "S": 1}]},
+                "out": 494.30142,
+            },
         ],
     },
     {
@@ -344,7 +392,189 @@ class TestXMLIntegrity:
             for case in data["included"]:
                 assert case["out"] == um.name2id_list(case["in"])
 
+    def test_missing_xml_file_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            unimod_mapper.UnimodMapper(xml_file_list=[tmp_path / "missing.xml"])
+
     def test_unimod_files_is_none(self):
         um = unimod_mapper.UnimodMapper(xml_file_list=None)
         names = [x.name for x in um.unimod_xml_names]
         assert names == ["usermod.xml", "unimod.xml"]
+
+
+def test_data_list_is_cached(tmp_path):
+    xml_file = tmp_path / "usermod.xml"
+    xml_file.write_text(usermod_path.read_text(encoding="utf-8"), encoding="utf-8")
+    um = unimod_mapper.UnimodMapper(xml_file_list=[xml_file], add_default_files=False)
+    signature = um._xml_signature(um.unimod_xml_names)
+    assert um._load_cache("data_list", signature) is None
+    um.mapper
+    cached_um = unimod_mapper.UnimodMapper(
+        xml_file_list=[xml_file], add_default_files=False
+    )
+    assert cached_um._load_cache("data_list", signature) is not None
+    assert cached_um.data_list == um.data_list
+    assert cached_um.name2id_list("TMTpro") == um.name2id_list("TMTpro")
+
+
+def test_lookups_build_only_their_index():
+    um = unimod_mapper.UnimodMapper(
+        xml_file_list=[usermod_path], add_default_files=False
+    )
+    assert um.name2id_list("TMTpro") == [""]
+    assert list(um._indices) == ["name"]
+    assert um._mapper is None
+
+
+def test_write_updates_mapper_in_place(tmp_path):
+    xml_file = tmp_path / "usermod.xml"
+    um = unimod_mapper.UnimodMapper(
+        xml_file_list=[usermod_path], add_default_files=False
+    )
+    entries = len(um.data_list)
+    um.writeXML({"mass": 12.5, "name": "First", "composition": {"C": 1}}, xml_file)
+    um.writeXML({"mass": 13.5, "name": "Second", "composition": {"C": 1}}, xml_file)
+    assert len(um.data_list) == entries + 2
+    assert um.name2id_list("First") == ["u1"]
+    assert um.mass2name_list(13.5) == ["Second"]
+    written_um = unimod_mapper.UnimodMapper(
+        xml_file_list=[xml_file], add_default_files=False
+    )
+    assert written_um.data_list == um.data_list[-2:]
+
+
+def test_write_adds_entries_of_other_files(tmp_path):
+    xml_file = tmp_path / "usermod.xml"
+    xml_file.write_text(usermod_path.read_text(encoding="utf-8"), encoding="utf-8")
+    um = unimod_mapper.UnimodMapper(
+        xml_file_list=[usermod_path], add_default_files=False
+    )
+    entries = len(um.data_list)
+    # the copied entries equal loaded ones, but are new to the mapper
+    um.writeXML({"mass": 12.5, "name": "First", "composition": {"C": 1}}, xml_file)
+    assert len(um.data_list) == 2 * entries + 1
+    assert um.name2id_list("TMTpro") == ["", ""]
+    # the entries of a file the mapper parsed are not added again
+    own_um = unimod_mapper.UnimodMapper(
+        xml_file_list=[xml_file], add_default_files=False
+    )
+    own_um.writeXML({"mass": 13.5, "name": "Second", "composition": {"C": 1}}, xml_file)
+    assert len(own_um.data_list) == entries + 2
+    written_um = unimod_mapper.UnimodMapper(
+        xml_file_list=[xml_file], add_default_files=False
+    )
+    assert written_um.data_list == own_um.data_list
+
+
+def test_write_creates_missing_usermod_file(tmp_path):
+    xml_file = tmp_path / "usermod.xml"
+    um = unimod_mapper.UnimodMapper(
+        xml_file_list=[xml_file, unimod_path], add_default_files=False
+    )
+    mod = {"aa": "K", "type": "opt", "position": "any", "name": "First"}
+    assert um.map_mods([mod]) == {"fix": [], "opt": []}
+    um.writeXML({"mass": 12.5, "name": "First", "composition": {"C": 1}}, xml_file)
+    mapped = um.map_mods([mod])["opt"]
+    assert [(m["name"], m["id"], m["mass"]) for m in mapped] == [("First", "u1", 12.5)]
+    assert um.name_to_mass("First") == [12.5]
+
+
+def test_failed_refresh_keeps_xml(tmp_path, monkeypatch):
+    xml_file = tmp_path / "unimod.xml"
+    xml_file.write_text("previous download")
+
+    def offline_get(*args, **kwargs):
+        raise unimod_mapper.unimod_mapper.requests.ConnectionError("offline")
+
+    monkeypatch.setattr(unimod_mapper.unimod_mapper.requests, "get", offline_get)
+    M._download_xml(xml_file)
+    assert xml_file.read_text() == "previous download"
+    assert list(tmp_path.iterdir()) == [xml_file]
+
+
+class DownloadResponse(object):
+    """Streamed response of requests.get, serving a small unimod.xml."""
+
+    def __init__(self, status_code, headers, content=b"<unimod/>"):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+
+def test_refresh_sends_etag(tmp_path, monkeypatch):
+    xml_file = tmp_path / "unimod.xml"
+    requests_headers = []
+
+    responses = [
+        DownloadResponse(200, {"ETag": '"v1"'}),
+        DownloadResponse(304, {}),
+        DownloadResponse(200, {"ETag": '"v2"'}, content=b"<unimod v2/>"),
+        DownloadResponse(304, {}),
+        DownloadResponse(304, {}),
+    ]
+
+    def get(url, headers=None, **kwargs):
+        requests_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(unimod_mapper.unimod_mapper.requests, "get", get)
+    M._download_xml(xml_file)
+    M._download_xml(xml_file)
+    assert "If-None-Match" not in requests_headers[0]
+    assert requests_headers[1]["If-None-Match"] == '"v1"'
+    assert xml_file.read_bytes() == b"<unimod/>"
+    # a changed ETag replaces the stored one
+    M._download_xml(xml_file)
+    M._download_xml(xml_file)
+    assert requests_headers[3]["If-None-Match"] == '"v2"'
+    assert xml_file.read_bytes() == b"<unimod v2/>"
+    # the stored ETag does not belong to a file replaced by hand
+    xml_file.write_text("restored backup")
+    M._download_xml(xml_file)
+    assert "If-None-Match" not in requests_headers[4]
+
+
+def test_refresh_ignores_broken_etag_file(tmp_path, monkeypatch):
+    xml_file = tmp_path / "unimod.xml"
+    xml_file.write_text("previous download")
+    tmp_path.joinpath("unimod.xml.etag").write_text("[]")
+    monkeypatch.setattr(
+        unimod_mapper.unimod_mapper.requests,
+        "get",
+        lambda url, headers=None, **kwargs: DownloadResponse(200, {}),
+    )
+
+    replace = os.replace
+
+    def failed_replace(src, dst):
+        raise PermissionError("read only")
+
+    monkeypatch.setattr(unimod_mapper.unimod_mapper.os, "replace", failed_replace)
+    M._download_xml(xml_file)
+    assert xml_file.read_text() == "previous download"
+    assert sorted(tmp_path.iterdir()) == [xml_file, xml_file.with_suffix(".xml.etag")]
+    monkeypatch.setattr(unimod_mapper.unimod_mapper.os, "replace", replace)
+    M._download_xml(xml_file)
+    assert xml_file.read_bytes() == b"<unimod/>"
+
+
+def test_mod_record_dict_access():
+    record = unimod_mapper.unimod_mapper.ModRecord("35", "Oxidation", {"O": 1})
+    assert record["unimodname"] == "Oxidation"
+    assert record["element"] == {"O": 1}
+    with pytest.raises(KeyError):
+        record["mono_mass"]
+    record.mono_mass = 15.994915
+    assert record.items()[-1] == ("mono_mass", 15.994915)
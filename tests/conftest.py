@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import pytest
+
+import unimod_mapper
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    # keep the pickles of the test mappers out of the user cache
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setattr(unimod_mapper.unimod_mapper, "cache_dir", path)
+    return path
@@ -1,28 +1,36 @@
+import types
+
+import pytest
+from loguru import logger
+
+import unimod_mapper
 from unimod_mapper import UnimodMapper
 import numpy as np
 
+
+@pytest.fixture(scope="session")
+def mapper():
+    # parsing unimod.xml dominates the runtime, so share one mapper across all tests
+    return UnimodMapper()
+
+
+# mods shared by several of the mod_lists below
+OXIDATION_MOD = {"aa": "M", "type": "opt", "position": "any", "name": "Oxidation"}
+CARBAMIDOMETHYL_MOD = {
+    "aa": "C",
+    "type": "fix",
+    "position": "any",
+    "name": "Carbamidomethyl",
+}
+ACETYL_MOD = {"aa": "*", "type": "opt", "position": "Prot-N-term", "name": "Acetyl"}
+
 mod_dict = {
     "ufiles": "",
     "parameters": {
         "modifications": [
-            {
-                "aa": "M",
-                "type": "opt",
-                "position": "any",
-                "name": "Oxidation",
-            },
-            {
-                "aa": "C",
-                "type": "fix",
-                "position": "any",
-                "name": "Carbamidomethyl",
-            },
-            {
-                "aa": "*",
-                "type": "opt",
-                "position": "Prot-N-term",
-                "name": "Acetyl",
-            },
+            OXIDATION_MOD,
+            CARBAMIDOMETHYL_MOD,
+            ACETYL_MOD,
         ]
     },
 }
@@ -97,20 +105,8 @@ mod_dict_nl = {
     "ufiles": "",
     "parameters": {
         "modifications": [
-            {
-                "aa": "M",
-                "type": "opt",
-                "position": "any",
-                "name": "Oxidation",
-                "neutral_loss": 0.0,
-            },
-            {
-                "aa": "C",
-                "type": "fix",
-                "position": "any",
-                "name": "Carbamidomethyl",
-                "neutral_loss": "unimod",
-            },
+            {**OXIDATION_MOD, "neutral_loss": 0.0},
+            {**CARBAMIDOMETHYL_MOD, "neutral_loss": "unimod"},
             {
                 "aa": "M",
                 "type": "fix",
@@ -126,27 +122,9 @@ mod_dict_name_id = {
     "ufiles": "",
     "parameters": {
         "modifications": [
-            {
-                "aa": "M",
-                "type": "opt",
-                "position": "any",
-                "name": "Oxidation",
-                "id": "35",
-            },
-            {
-                "aa": "C",
-                "type": "fix",
-                "position": "any",
-                "name": "Carbamidomethyl",
-                "id": "4",
-            },
-            {
-                "aa": "*",
-                "type": "opt",
-                "position": "Prot-N-term",
-                "name": "Acetyl",
-                "id": "1",
-            },
+            {**OXIDATION_MOD, "id": "35"},
+            {**CARBAMIDOMETHYL_MOD, "id": "4"},
+            {**ACETYL_MOD, "id": "1"},
         ]
     },
 }
@@ -155,323 +133,366 @@ mod_dict_name_wrong_id = {
     "ufiles": "",
     "parameters": {
         "modifications": [
-            {
-                "aa": "M",
-                "type": "opt",
-                "position": "any",
-                "name": "Oxidation",
-                "id": "3567",
-            },
+            {**OXIDATION_MOD, "id": "3567"},
+            {**CARBAMIDOMETHYL_MOD, "id": "4567"},
+            {**ACETYL_MOD, "id": "1"},  # only this one is correct
+        ]
+    },
+}
+
+# expected results are shared, read-only module constants; their "org" values are
+# literals of their own, so mods that map_mods changes in place can not hide a mismatch
+CARBAMIDOMETHYL_COMPOSITION = {"H": 3, "C": 2, "N": 1, "O": 1}
+OXIDATION_COMPOSITION = {"O": 1}
+ACETYL_COMPOSITION = {"H": 2, "C": 2, "O": 1}
+
+unimod_dict = types.MappingProxyType(
+    {
+        "fix": [
             {
                 "aa": "C",
-                "type": "fix",
                 "position": "any",
                 "name": "Carbamidomethyl",
-                "id": "4567",
+                "mass": 57.021464,
+                "composition": CARBAMIDOMETHYL_COMPOSITION,
+                "id": "4",
+                "neutral_loss": None,
+                "_id": 1,
+                "org": {
+                    "aa": "C",
+                    "type": "fix",
+                    "position": "any",
+                    "name": "Carbamidomethyl",
+                },
+                "unimod": True,
+            }
+        ],
+        "opt": [
+            {
+                "aa": "M",
+                "position": "any",
+                "name": "Oxidation",
+                "mass": 15.994915,
+                "composition": OXIDATION_COMPOSITION,
+                "id": "35",
+                "neutral_loss": None,
+                "_id": 0,
+                "org": {
+                    "aa": "M",
+                    "type": "opt",
+                    "position": "any",
+                    "name": "Oxidation",
+                },
+                "unimod": True,
             },
             {
                 "aa": "*",
-                "type": "opt",
                 "position": "Prot-N-term",
                 "name": "Acetyl",
-                "id": "1",  # only this one is correct
+                "mass": 42.010565,
+                "composition": ACETYL_COMPOSITION,
+                "id": "1",
+                "neutral_loss": None,
+                "_id": 2,
+                "org": {
+                    "aa": "*",
+                    "type": "opt",
+                    "position": "Prot-N-term",
+                    "name": "Acetyl",
+                },
+                "unimod": True,
             },
-        ]
-    },
-}
+        ],
+    }
+)
 
-unimod_dict = {
-    "fix": [
-        {
-            "aa": "C",
-            "position": "any",
-            "name": "Carbamidomethyl",
-            "mass": 57.021464,
-            "composition": {"H": 3, "C": 2, "N": 1, "O": 1},
-            "id": "4",
-            "neutral_loss": None,
-            "_id": 1,
-            "org": {
+unimod_dict_id = types.MappingProxyType(
+    {
+        "fix": [
+            {
                 "aa": "C",
-                "type": "fix",
                 "position": "any",
                 "name": "Carbamidomethyl",
+                "mass": 57.021464,
+                "composition": CARBAMIDOMETHYL_COMPOSITION,
+                "id": "4",
+                "neutral_loss": None,
+                "_id": 1,
+                "org": {"aa": "C", "type": "fix", "position": "any", "id": "4"},
+                "unimod": True,
+            }
+        ],
+        "opt": [
+            {
+                "aa": "M",
+                "position": "any",
+                "name": "Oxidation",
+                "mass": 15.994915,
+                "composition": OXIDATION_COMPOSITION,
+                "id": "35",
+                "neutral_loss": None,
+                "_id": 0,
+                "org": {"aa": "M", "type": "opt", "position": "any", "id": "35"},
+                "unimod": True,
             },
-            "unimod": True,
-        }
-    ],
-    "opt": [
-        {
-            "aa": "M",
-            "position": "any",
-            "name": "Oxidation",
-            "mass": 15.994915,
-            "composition": {"O": 1},
-            "id": "35",
-            "neutral_loss": None,
-            "_id": 0,
-            "org": {"aa": "M", "type": "opt", "position": "any", "name": "Oxidation"},
-            "unimod": True,
-        },
-        {
-            "aa": "*",
-            "position": "Prot-N-term",
-            "name": "Acetyl",
-            "mass": 42.010565,
-            "composition": {"H": 2, "C": 2, "O": 1},
-            "id": "1",
-            "neutral_loss": None,
-            "_id": 2,
-            "org": {
+            {
                 "aa": "*",
-                "type": "opt",
                 "position": "Prot-N-term",
                 "name": "Acetyl",
+                "mass": 42.010565,
+                "composition": ACETYL_COMPOSITION,
+                "id": "1",
+                "neutral_loss": None,
+                "_id": 2,
+                "org": {"aa": "*", "type": "opt", "position": "Prot-N-term", "id": "1"},
+                "unimod": True,
             },
-            "unimod": True,
-        },
-    ],
-}
-
-unimod_dict_id = {
-    "fix": [
-        {
-            "aa": "C",
-            "position": "any",
-            "name": "Carbamidomethyl",
-            "mass": 57.021464,
-            "composition": {"H": 3, "C": 2, "N": 1, "O": 1},
-            "id": "4",
-            "neutral_loss": None,
-            "_id": 1,
-            "org": {"aa": "C", "type": "fix", "position": "any", "id": "4"},
-            "unimod": True,
-        }
-    ],
-    "opt": [
-        {
-            "aa": "M",
-            "position": "any",
-            "name": "Oxidation",
-            "mass": 15.994915,
-            "composition": {"O": 1},
-            "id": "35",
-            "neutral_loss": None,
-            "_id": 0,
-            "org": {"aa": "M", "type": "opt", "position": "any", "id": "35"},
-            "unimod": True,
-        },
-        {
-            "aa": "*",
-            "position": "Prot-N-term",
-            "name": "Acetyl",
-            "mass": 42.010565,
-            "composition": {"H": 2, "C": 2, "O": 1},
-            "id": "1",
-            "neutral_loss": None,
-            "_id": 2,
-            "org": {"aa": "*", "type": "opt", "position": "Prot-N-term", "id": "1"},
-            "unimod": True,
-        },
-    ],
-}
+        ],
+    }
+)
 
-unimod_dict_with_nl = {
-    "fix": [
-        {
-            "aa": "C",
-            "position": "any",
-            "name": "Carbamidomethyl",
-            "mass": 57.021464,
-            "composition": {"H": 3, "C": 2, "N": 1, "O": 1},
-            "id": "4",
-            "neutral_loss": 0.0,
-            "_id": 1,
-            "org": {
+unimod_dict_with_nl = types.MappingProxyType(
+    {
+        "fix": [
+            {
                 "aa": "C",
-                "type": "fix",
                 "position": "any",
                 "name": "Carbamidomethyl",
-                "neutral_loss": "unimod",
+                "mass": 57.021464,
+                "composition": CARBAMIDOMETHYL_COMPOSITION,
+                "id": "4",
+                "neutral_loss": 0.0,
+                "_id": 1,
+                "org": {
+                    "aa": "C",
+                    "type": "fix",
+                    "position": "any",
+                    "name": "Carbamidomethyl",
+                    "neutral_loss": "unimod",
+                },
+                "unimod": True,
             },
-            "unimod": True,
-        },
-        {
-            "aa": "M",
-            "position": "any",
-            "name": "Carbamidomethyl",
-            "mass": 57.021464,
-            "composition": {"H": 3, "C": 2, "N": 1, "O": 1},
-            "id": "4",
-            "neutral_loss": 105.024835,
-            "_id": 2,
-            "org": {
+            {
                 "aa": "M",
-                "type": "fix",
                 "position": "any",
                 "name": "Carbamidomethyl",
-                "neutral_loss": "unimod",
+                "mass": 57.021464,
+                "composition": CARBAMIDOMETHYL_COMPOSITION,
+                "id": "4",
+                "neutral_loss": 105.024835,
+                "_id": 2,
+                "org": {
+                    "aa": "M",
+                    "type": "fix",
+                    "position": "any",
+                    "name": "Carbamidomethyl",
+                    "neutral_loss": "unimod",
+                },
+                "unimod": True,
             },
-            "unimod": True,
-        },
-    ],
-    "opt": [
-        {
-            "aa": "M",
-            "position": "any",
-            "name": "Oxidation",
-            "mass": 15.994915,
-            "composition": {"O": 1},
-            "id": "35",
-            "neutral_loss": 0.0,
-            "_id": 0,
-            "org": {
+        ],
+        "opt": [
+            {
                 "aa": "M",
-                "type": "opt",
                 "position": "any",
                 "name": "Oxidation",
+                "mass": 15.994915,
+                "composition": OXIDATION_COMPOSITION,
+                "id": "35",
                 "neutral_loss": 0.0,
-            },
-            "unimod": True,
-        }
-    ],
-}
+                "_id": 0,
+                "org": {
+                    "aa": "M",
+                    "type": "opt",
+                    "position": "any",
+                    "name": "Oxidation",
+                    "neutral_loss": 0.0,
+                },
+                "unimod": True,
+            }
+        ],
+    }
+)
 
-unimod_dict_name_id = {
-    "fix": [
-        {
-            "aa": "C",
-            "position": "any",
-            "name": "Carbamidomethyl",
-            "mass": 57.021464,
-            "composition": {"H": 3, "C": 2, "N": 1, "O": 1},
-            "id": "4",
-            "neutral_loss": None,
-            "_id": 1,
-            "org": {
+unimod_dict_name_id = types.MappingProxyType(
+    {
+        "fix": [
+            {
                 "aa": "C",
-                "type": "fix",
                 "position": "any",
                 "name": "Carbamidomethyl",
+                "mass": 57.021464,
+                "composition": CARBAMIDOMETHYL_COMPOSITION,
                 "id": "4",
-            },
-            "unimod": True,
-        }
-    ],
-    "opt": [
-        {
-            "aa": "M",
-            "position": "any",
-            "name": "Oxidation",
-            "mass": 15.994915,
-            "composition": {"O": 1},
-            "id": "35",
-            "neutral_loss": None,
-            "_id": 0,
-            "org": {
+                "neutral_loss": None,
+                "_id": 1,
+                "org": {
+                    "aa": "C",
+                    "type": "fix",
+                    "position": "any",
+                    "name": "Carbamidomethyl",
+                    "id": "4",
+                },
+                "unimod": True,
+            }
+        ],
+        "opt": [
+            {
                 "aa": "M",
-                "type": "opt",
                 "position": "any",
                 "name": "Oxidation",
+                "mass": 15.994915,
+                "composition": OXIDATION_COMPOSITION,
                 "id": "35",
+                "neutral_loss": None,
+                "_id": 0,
+                "org": {
+                    "aa": "M",
+                    "type": "opt",
+                    "position": "any",
+                    "name": "Oxidation",
+                    "id": "35",
+                },
+                "unimod": True,
             },
-            "unimod": True,
-        },
-        {
-            "aa": "*",
-            "position": "Prot-N-term",
-            "name": "Acetyl",
-            "mass": 42.010565,
-            "composition": {"H": 2, "C": 2, "O": 1},
-            "id": "1",
-            "neutral_loss": None,
-            "_id": 2,
-            "org": {
+            {
                 "aa": "*",
-                "type": "opt",
                 "position": "Prot-N-term",
                 "name": "Acetyl",
+                "mass": 42.010565,
+                "composition": ACETYL_COMPOSITION,
                 "id": "1",
+                "neutral_loss": None,
+                "_id": 2,
+                "org": {
+                    "aa": "*",
+                    "type": "opt",
+                    "position": "Prot-N-term",
+                    "name": "Acetyl",
+                    "id": "1",
+                },
+                "unimod": True,
             },
-            "unimod": True,
-        },
-    ],
-}
+        ],
+    }
+)
 
-unimod_dict_name_wrong_id = {
-    "fix": [],
-    "opt": [
-        {
-            "aa": "*",
-            "position": "Prot-N-term",
-            "name": "Acetyl",
-            "mass": 42.010565,
-            "composition": {"H": 2, "C": 2, "O": 1},
-            "id": "1",
-            "neutral_loss": None,
-            "_id": 2,
-            "org": {
+unimod_dict_name_wrong_id = types.MappingProxyType(
+    {
+        "fix": [],
+        "opt": [
+            {
                 "aa": "*",
-                "type": "opt",
                 "position": "Prot-N-term",
                 "name": "Acetyl",
+                "mass": 42.010565,
+                "composition": ACETYL_COMPOSITION,
                 "id": "1",
-            },
-            "unimod": True,
-        }
-    ],
-}
+                "neutral_loss": None,
+                "_id": 2,
+                "org": {
+                    "aa": "*",
+                    "type": "opt",
+                    "position": "Prot-N-term",
+                    "name": "Acetyl",
+                    "id": "1",
+                },
+                "unimod": True,
+            }
+        ],
+    }
+)
 
 
-def test_map_mods_by_name():
-    _output = UnimodMapper().map_mods(mod_list=mod_dict["parameters"]["modifications"])
-    assert _output == unimod_dict
+@pytest.mark.parametrize(
+    "mods, expected",
+    [
+        (mod_dict["parameters"]["modifications"], unimod_dict),
+        (mod_dict_not_in_unimod["parameters"]["modifications"], {"fix": [], "opt": []}),
+        (mod_dict_id["parameters"]["modifications"], unimod_dict_id),
+        (
+            mod_dict_id_not_in_unimod["parameters"]["modifications"],
+            {"fix": [], "opt": []},
+        ),
+        (mod_dict_nl["parameters"]["modifications"], unimod_dict_with_nl),
+        (mod_dict_name_id["parameters"]["modifications"], unimod_dict_name_id),
+        (
+            mod_dict_name_wrong_id["parameters"]["modifications"],
+            unimod_dict_name_wrong_id,
+        ),
+    ],
+    ids=[
+        "by_name",
+        "by_name_mod_not_in_unimod",
+        "by_id",
+        "mod_not_in_unimod_by_id",
+        "neutral_loss",
+        "name_and_id",
+        "name_and_wrong_id",
+    ],
+)
+def test_map_mods(mapper, mods, expected):
+    assert mapper.map_mods(mod_list=mods) == expected
 
 
-def test_map_mods_by_name_mod_not_in_unimod():
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_not_in_unimod["parameters"]["modifications"]
-    )
-    assert _output == {"fix": [], "opt": []}
+def test_map_mods_cached_results_are_copies(mapper):
+    mods = [{"aa": "M", "type": "opt", "position": "any", "name": "Oxidation"}]
+    first = mapper.map_mods(mod_list=mods)
+    first["opt"][0]["name"] = "Changed"
+    same_mods = [dict(mods[0])]
+    second = mapper.map_mods(mod_list=same_mods)
+    assert second["opt"][0]["name"] == "Oxidation"
+    assert second["opt"][0]["org"] is same_mods[0]
 
 
-def test_map_mods_by_id():
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_id["parameters"]["modifications"]
-    )
-    assert _output == unimod_dict_id
+def test_map_mods_cache_is_bounded(mapper, monkeypatch):
+    monkeypatch.setattr(unimod_mapper.unimod_mapper, "map_mods_cache_size", 2)
+    mapper._map_mods_cache.clear()
+    for name in ("Oxidation", "Acetyl", "Carbamidomethyl"):
+        mapper.map_mods([{"aa": "*", "type": "opt", "position": "any", "name": name}])
+    assert len(mapper._map_mods_cache) == 2
 
 
-def test_map_mods_mod_not_in_unimod_by_id():
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_id_not_in_unimod["parameters"]["modifications"]
-    )
-    assert _output == {"fix": [], "opt": []}
+def test_map_mods_cache_keeps_value_types(mapper):
+    mapped = mapper.map_mods([{**OXIDATION_MOD, "neutral_loss": 0}])
+    assert type(mapped["opt"][0]["neutral_loss"]) is int
+    mapped = mapper.map_mods([{**OXIDATION_MOD, "neutral_loss": 0.0}])
+    assert type(mapped["opt"][0]["neutral_loss"]) is float
 
 
-def test_map_mods_neutral_loss():
-    import pprint
+def test_map_mods_repeats_warnings(mapper):
+    messages = []
+    sink_id = logger.add(messages.append, level="WARNING")
+    mods = [{"aa": "M", "type": "opt", "position": "any", "name": "NoUnimodName"}]
+    try:
+        mapper.map_mods(mods)
+        mapper.map_mods(mods)
+    finally:
+        logger.remove(sink_id)
+    assert len(messages) == 2
 
-    pprint.pprint(mod_dict_nl["parameters"]["modifications"])
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_nl["parameters"]["modifications"]
+
+def test_map_mods_batch(mapper):
+    _output = mapper.map_mods_batch(
+        aa=["M", "C", "*"],
+        type=["opt", "fix", "opt"],
+        position=["any", "any", "Prot-N-term"],
+        name=["Oxidation", "Carbamidomethyl", "Acetyl"],
     )
-    print("Output")
-    pprint.pprint(_output)
-    print("Expected")
-    pprint.pprint(unimod_dict_with_nl)
-    assert _output == unimod_dict_with_nl
+    assert _output == unimod_dict
 
 
-def test_map_mods_name_and_id():
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_name_id["parameters"]["modifications"]
-    )
-    assert _output == unimod_dict_name_id
+def test_map_mods_batch_length_mismatch(mapper):
+    with pytest.raises(ValueError):
+        mapper.map_mods_batch(aa=["M", "C"], type=["opt"], position=["any", "any"])
 
 
-def test_map_mods_name_and_wrong_id():
-    _output = UnimodMapper().map_mods(
-        mod_list=mod_dict_name_wrong_id["parameters"]["modifications"]
+def test_map_mods_many(mapper):
+    _output = mapper.map_mods_many(
+        [
+            mod_dict["parameters"]["modifications"],
+            mod_dict_id["parameters"]["modifications"],
+            mod_dict_not_in_unimod["parameters"]["modifications"],
+        ]
     )
-    assert _output == unimod_dict_name_wrong_id
+    assert _output == [unimod_dict, unimod_dict_id, {"fix": [], "opt": []}]
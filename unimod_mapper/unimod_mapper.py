@@ -18,14 +18,19 @@
 """
 import sys
 import os
-import codecs
+import hashlib
+import pickle
+import tempfile
+import email.utils
+import json
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as xmldom
 import requests
+from lxml import etree
 
 import bisect
 import numpy as np
 import itertools
+from collections import OrderedDict
 import pandas as pd
 
 
@@ -35,6 +40,103 @@ from loguru import logger
 # define the url from where unimod.xml file should be retrieved
 url = "http://www.unimod.org/xml/unimod.xml"
 
+# modification types map_mods sorts the mapped mods into
+mod_types = ("fix", "opt")
+# number of distinct mod_lists map_mods keeps the results of
+map_mods_cache_size = 1024
+
+# symbols leading the Hill notation, all other symbols follow alphabetically
+hill_majors = ("C", "H")
+
+# local names of the xml tags the parsers handle, see UnimodMapper._xml_tags
+xml_tag_names = ("mod", "delta", "element", "specificity", "NeutralLoss", "alt_name")
+
+# ModRecord fields the legacy lookups are indexed by, see UnimodMapper._index
+index_fields = {"name": "unimodname", "id": "unimodID", "mass": "mono_mass"}
+
+# characters of the numeric accessions UnimodMapper._id_rows looks up by position
+accession_digits = frozenset("0123456789")
+
+# parsed xml files are pickled into this folder and reused until the files change,
+# it is per user instead of inside the package, which may be read-only or shared
+cache_dir = Path(
+    os.environ.get(
+        "UNIMOD_MAPPER_CACHE_DIR",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "unimod_mapper",
+    )
+)
+# number of pickles kept in cache_dir, the least recently written are removed
+cache_size = 16
+# increase whenever the structure of the pickled parse results changes
+cache_version = 2
+
+
+class ModRecord(object):
+    """
+    Modification entry parsed from a unimod xml file.
+
+    Uses __slots__ instead of a per entry dict, since thousands of these are
+    kept in memory. For compatibility, fields can still be read like dict
+    items, e.g. record["mono_mass"]; unset fields raise a KeyError.
+    """
+
+    __slots__ = (
+        "unimodID",
+        "unimodname",
+        "element",
+        "specificity",
+        "neutral_loss",
+        "mono_mass",
+    )
+
+    def __init__(
+        self,
+        unimodID,
+        unimodname,
+        element=None,
+        specificity=None,
+        neutral_loss=None,
+        mono_mass=None,
+    ):
+        """Initialize record.
+
+        Args:
+            unimodID (str): unimod accession
+            unimodname (str): unimod title
+            element (dict, optional): composition mapping symbol to number
+            specificity (list, optional): list of (site, classification) tuples
+            neutral_loss (list, optional): list of (site, neutral loss) tuples
+            mono_mass (float, optional): mono isotopic mass, unset if None
+        """
+        self.unimodID = unimodID
+        self.unimodname = unimodname
+        self.element = {} if element is None else element
+        self.specificity = [] if specificity is None else specificity
+        self.neutral_loss = [] if neutral_loss is None else neutral_loss
+        if mono_mass is not None:
+            self.mono_mass = mono_mass
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def items(self):
+        """Get (field, value) pairs of all set fields."""
+        return [
+            (key, getattr(self, key)) for key in self.__slots__ if hasattr(self, key)
+        ]
+
+    def __eq__(self, other):
+        if not isinstance(other, ModRecord):
+            return NotImplemented
+        return self.items() == other.items()
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.items())
+        return f"ModRecord({fields})"
+
 
 class UnimodMapper(object):
     """
@@ -66,14 +168,27 @@ class UnimodMapper(object):
             refresh_xml (bool, optional): Force fresh download of unimod.xml
             xml_file_list (None, optional): list of user unimod xml files
             add_default_files (bool, optional): Add default unimod files
+
+        Raises:
+            FileNotFoundError: if an xml file other than usermod.xml does not exist
         """
         if xml_file_list is None:
             xml_file_list = []
         self._data_list = None
         self._mapper = None
+        self._indices = {}
         self._df = None
+        self._df_indices = {}
+        self._id_table = None
+        self._sorted_names = None
         self._elements = []
         self._combos = {}
+        self._mass_arr = None
+        self._mass_order = None
+        self._sorted_masses = None
+        self._map_mods_cache = OrderedDict()
+        # (unimodID, unimodname) of the entries in data_list per written xml file
+        self._xml_entries = {}
 
         # Check if unimod.xml file exists & if not reset refresh_xml flag
         full_path = Path(__file__).parent / "unimod.xml"
@@ -81,9 +196,7 @@ class UnimodMapper(object):
             refresh_xml = True
 
         if refresh_xml is True:
-            response = requests.get(url)
-            with open(full_path, "wb") as file:
-                file.write(response.content)
+            self._download_xml(full_path)
 
         self.unimod_xml_names = xml_file_list.copy()
         if add_default_files is True:
@@ -92,11 +205,24 @@ class UnimodMapper(object):
                 if xml not in names:
                     self.unimod_xml_names.append(Path(__file__).parent.joinpath(xml))
 
+        # validate the files once, a missing usermod.xml is kept, since writeXML
+        # may create it, and is skipped by the parsers until then
+        self._xml_paths = []
+        for xml_file in self.unimod_xml_names:
+            xml_path = Path(xml_file)
+            if xml_path.exists() is False:
+                if xml_path.name != "usermod.xml":
+                    raise FileNotFoundError(
+                        f"No {xml_path.name} file found. Expected at {xml_path}"
+                    )
+                logger.debug(f"No usermod.xml file found. Expected at {xml_path}")
+            self._xml_paths.append(xml_path)
+
     @property
     def data_list(self):
         """Get list of unimods."""
         if self._data_list is None:
-            self._data_list = self._parseXML(xml_file_list=self.unimod_xml_names)
+            self._load_data_list()
         return self._data_list
 
     @data_list.setter
@@ -130,7 +256,12 @@ class UnimodMapper(object):
             pd.DataFrame: unimod table
         """
         if self._df is None:
-            self._df = pd.DataFrame(self._parse_in_more_detail_XML())
+            signature = self._xml_signature(self._xml_paths)
+            records = self._load_cache("df", signature)
+            if records is None:
+                records = self._parse_in_more_detail_XML()
+                self._dump_cache("df", signature, records)
+            self._df = pd.DataFrame(records)
             self._df = self._df.explode("specificity").reset_index(drop=True)
             sites = self._df.specificity.str.split("<\|>", expand=True)
             sites.columns = [
@@ -146,6 +277,292 @@ class UnimodMapper(object):
             self._df.neutral_losses = self._df.neutral_losses.astype(float)
         return self._df
 
+    def _download_xml(self, xml_path):
+        """Download unimod.xml, unless it did not change since the last download.
+
+        The response is streamed into a temporary file that replaces xml_path once
+        the download is complete, so a failed download keeps the previous file.
+        ETag and Last-Modified of the download are kept next to xml_path and sent
+        with the next request, so the server can answer 304 Not Modified. They
+        are only sent while size and mtime of xml_path match the ones stored
+        with them, so a file replaced by hand is downloaded again.
+
+        Args:
+            xml_path (Path): target path of unimod.xml
+        """
+        validators_path = xml_path.with_name(xml_path.name + ".etag")
+        headers = {}
+        if xml_path.exists():
+            stat = xml_path.stat()
+            headers["If-Modified-Since"] = email.utils.formatdate(
+                stat.st_mtime, usegmt=True
+            )
+            try:
+                validators = json.loads(validators_path.read_text())
+            except (OSError, ValueError):
+                validators = {}
+            if (
+                isinstance(validators, dict) is False
+                or validators.get("size") != stat.st_size
+                or validators.get("mtime_ns") != stat.st_mtime_ns
+            ):
+                # not written for the current file
+                validators = {}
+            if validators.get("ETag"):
+                headers["If-None-Match"] = validators["ETag"]
+            if validators.get("Last-Modified"):
+                headers["If-Modified-Since"] = validators["Last-Modified"]
+        tmp_path = None
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 304:
+                    logger.debug(f"{xml_path.name} is up to date")
+                    return
+                response.raise_for_status()
+                with tempfile.NamedTemporaryFile(
+                    "wb", dir=xml_path.parent, suffix=".tmp", delete=False
+                ) as tmp_file:
+                    tmp_path = tmp_file.name
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        tmp_file.write(chunk)
+            os.replace(tmp_path, xml_path)
+        except (requests.RequestException, OSError) as e:
+            if xml_path.exists() is False:
+                raise
+            logger.warning(f"Could not refresh {xml_path.name}, keeping old file: {e}")
+            return
+        finally:
+            # only left over if the download or the replace failed
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        validators = {
+            key: response.headers[key]
+            for key in ("ETag", "Last-Modified")
+            if key in response.headers
+        }
+        try:
+            stat = xml_path.stat()
+            validators.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            validators_path.write_text(json.dumps(validators))
+        except OSError as e:
+            logger.debug(f"Could not write {validators_path}: {e}")
+
+    def _load_data_list(self):
+        """Set data_list from the cache or by parsing the xml files.
+
+        If the cache is missing or outdated, the xml files are parsed and
+        the result is cached for following mappers.
+        """
+        signature = self._xml_signature(self._xml_paths)
+        data_list = self._load_cache("data_list", signature)
+        if data_list is None:
+            data_list = self._parseXML(xml_file_list=self._existing_xml_paths())
+            self._dump_cache("data_list", signature, data_list)
+        self._data_list = data_list
+
+    def _existing_xml_paths(self):
+        """Get the xml files of this mapper that exist.
+
+        Returns:
+            list: list of xml paths
+        """
+        return [xml_path for xml_path in self._xml_paths if xml_path.exists()]
+
+    def _xml_signature(self, xml_file_list):
+        """Get a signature of the current state of the given xml files.
+
+        Args:
+            xml_file_list (list): list of xml files
+
+        Returns:
+            tuple: (path, mtime, size) for every existing file
+        """
+        signature = []
+        for xml_file in xml_file_list:
+            try:
+                stat = os.stat(xml_file)
+            except FileNotFoundError:
+                continue
+            signature.append(
+                (str(Path(xml_file).resolve()), stat.st_mtime_ns, stat.st_size)
+            )
+        return tuple(signature)
+
+    def _cache_path(self, kind, signature):
+        """Get the path of the cache file for a kind of parse result.
+
+        Args:
+            kind (str): name of the parse result
+            signature (tuple): signature of the parsed xml files
+
+        Returns:
+            Path: path of the pickle file
+        """
+        paths = "|".join(entry[0] for entry in signature)
+        digest = hashlib.sha1(f"{kind}|{paths}".encode("utf-8")).hexdigest()
+        return cache_dir / f"{kind}_{digest[:16]}.pkl"
+
+    def _load_cache(self, kind, signature):
+        """Load pickled parse results.
+
+        Args:
+            kind (str): name of the parse result
+            signature (tuple): signature of the parsed xml files
+
+        Returns:
+            cached parse result or None if no valid cache exists
+        """
+        cache_path = self._cache_path(kind, signature)
+        try:
+            version, cached_signature, data = pickle.loads(cache_path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable cache {cache_path}: {e}")
+            return None
+        if version != cache_version or cached_signature != signature:
+            return None
+        logger.debug(f"Loaded {kind} from cache ({cache_path})")
+        # pickle stores every shared object once, so strings interned while
+        # parsing are still shared within the loaded data, just no longer
+        # interned, i.e. not shared with equal strings outside of it
+        return data
+
+    def _dump_cache(self, kind, signature, data):
+        """Pickle parse results, so following mappers can skip parsing.
+
+        The file is written to a temporary file first and then moved in place,
+        so concurrent mappers never read a partially written cache. Every set
+        of xml files gets its own pickle, so only the newest cache_size
+        pickles are kept.
+
+        Args:
+            kind (str): name of the parse result
+            signature (tuple): signature of the parsed xml files
+            data: parse result
+        """
+        cache_path = self._cache_path(kind, signature)
+        tmp_path = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=cache_dir, suffix=".tmp", delete=False
+            ) as tmp_file:
+                tmp_path = tmp_file.name
+                pickle.dump(
+                    (cache_version, signature, data),
+                    tmp_file,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, cache_path)
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            logger.debug(f"Could not write cache {cache_path}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            return
+        self._prune_cache()
+
+    def _prune_cache(self):
+        """Remove all but the cache_size most recently written pickles."""
+        try:
+            cache_paths = sorted(
+                cache_dir.glob("*.pkl"), key=lambda path: path.stat().st_mtime_ns
+            )
+            for cache_path in cache_paths[: len(cache_paths) - cache_size]:
+                cache_path.unlink()
+        except OSError as e:
+            # e.g. the file was removed by a concurrent mapper
+            logger.debug(f"Could not prune cache {cache_dir}: {e}")
+
+    def _df_index(self, column):
+        """Get the dict mapping values of a df column to their row positions.
+
+        Args:
+            column (str|tuple): df column, or tuple of columns for an index on
+                tuples of their values
+
+        Returns:
+            dict: value -> row positions
+        """
+        if column not in self._df_indices:
+            by = list(column) if isinstance(column, tuple) else column
+            self._df_indices[column] = self.df.groupby(by, sort=False).indices
+        return self._df_indices[column]
+
+    def _id_rows(self, id):
+        """Get the row positions of the unimod df for a unimod accession.
+
+        Unimod accessions are small dense integers, so they are used as index
+        into a list directly. The list only reaches as far as the accessions
+        are dense, larger and non-numeric accessions, e.g. of usermods, are
+        looked up in the Accession dict.
+
+        Args:
+            id (str|int): unimod accession
+
+        Returns:
+            list: row positions in df order
+        """
+        if isinstance(id, str) and self._is_accession_number(id):
+            id = int(id)
+        if not isinstance(id, int):
+            return self._df_rows("Accession", id)
+        if self._id_table is None:
+            index = self._df_index("Accession")
+            numeric_ids = {
+                int(accession): rows
+                for accession, rows in index.items()
+                if self._is_accession_number(accession)
+            }
+            size = min(max(numeric_ids, default=-1) + 1, 4 * len(numeric_ids) + 64)
+            self._id_table = [[]] * size
+            for accession, rows in numeric_ids.items():
+                if accession < size:
+                    self._id_table[accession] = rows
+        if 0 <= id < len(self._id_table):
+            return self._id_table[id]
+        return self._df_rows("Accession", str(id))
+
+    @staticmethod
+    def _is_accession_number(accession):
+        """Check if an accession is written as a plain decimal integer.
+
+        Args:
+            accession (str): unimod accession
+
+        Returns:
+            bool: True for ASCII digits without leading zero
+        """
+        return (
+            accession != ""
+            and accession[0] != "0"
+            and accession_digits.issuperset(accession)
+        )
+
+    def _df_rows(self, column, value):
+        """Get the row positions of the unimod df where `column` equals `value`.
+
+        The lookup dict for a column is built once on first use, so repeated
+        lookups are a dict probe instead of a query over the whole df.
+
+        Args:
+            column (str|tuple): df column(s) to match, see _df_index
+            value (str|tuple|list): value to match, a list matches any of its values
+
+        Returns:
+            list: row positions in df order
+        """
+        index = self._df_index(column)
+        if isinstance(value, list):
+            rows = set()
+            for v in value:
+                rows.update(index.get(v, []))
+            return sorted(rows)
+        return index.get(value, [])
+
     def query(self, query_string):
         """Query the dataframe with a pandas style query
 
@@ -166,7 +583,25 @@ class UnimodMapper(object):
         Returns:
             list: list of masses
         """
-        return self.df.query("`Name` == @name")["mono_mass"].to_list()
+        return self.df["mono_mass"].iloc[self._df_rows("Name", name)].to_list()
+
+    def prefix_to_names(self, prefix):
+        """Get all names starting with a given prefix
+
+        Args:
+            prefix (str): beginning of the unimod names, e.g. "Methyl"
+
+        Returns:
+            list: sorted list of unique names
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._df_index("Name"))
+        names = self._sorted_names
+        lower_index = bisect.bisect_left(names, prefix)
+        upper_index = lower_index
+        while upper_index < len(names) and names[upper_index].startswith(prefix):
+            upper_index += 1
+        return names[lower_index:upper_index]
 
     def name_to_composition(self, name):
         """Get composition for a given name
@@ -177,7 +612,7 @@ class UnimodMapper(object):
         Returns:
             list: list of compositions
         """
-        return self.df.query("`Name` == @name")["elements"].to_list()
+        return self.df["elements"].iloc[self._df_rows("Name", name)].to_list()
 
     def name_to_neutral_loss(self, name):
         """Get neutral loss for a given name
@@ -189,7 +624,8 @@ class UnimodMapper(object):
             list: list of neutral losses
         """
         return (
-            self.df.query("`Name` == @name")[["Site", "neutral_losses"]]
+            self.df[["Site", "neutral_losses"]]
+            .iloc[self._df_rows("Name", name)]
             .to_numpy()
             .tolist()
         )
@@ -203,40 +639,40 @@ class UnimodMapper(object):
         Returns:
             list: list of unimod ids
         """
-        return self.df.query("`Name` == @name")["Accession"].to_list()
+        return self.df["Accession"].iloc[self._df_rows("Name", name)].to_list()
 
     def id_to_mass(self, id):
         """Get mass for a given id
 
         Args:
-            name (str): id of the unimod
+            id (str|int): id of the unimod
 
         Returns:
             list: list of masses
         """
-        return self.df.query("`Accession` == @id")["mono_mass"].to_list()
+        return self.df["mono_mass"].iloc[self._id_rows(id)].to_list()
 
     def id_to_composition(self, id):
         """Get composition for a given id
 
         Args:
-            name (str): id of the unimod
+            id (str|int): id of the unimod
 
         Returns:
             list: list of compositions
         """
-        return self.df.query("`Accession` == @id")["elements"].to_list()
+        return self.df["elements"].iloc[self._id_rows(id)].to_list()
 
     def id_to_name(self, id):
         """Get name for a given id
 
         Args:
-            name (str): id of the unimod
+            id (str|int): id of the unimod
 
         Returns:
             list: list of names
         """
-        return self.df.query("`Accession` == @id")["Name"].to_list()
+        return self.df["Name"].iloc[self._id_rows(id)].to_list()
 
     def _determine_mass_range(self, mass, decimals=0):
         fraction = 1 / 10 ** (decimals + 1)
@@ -332,21 +768,36 @@ class UnimodMapper(object):
             mass_list.append((combo_mass, combo_name))
         return sorted(mass_list)
 
+    def _xml_tags(self, root_tag):
+        """Map the tags of an xml file to their local names.
+
+        Comparing full tags with a dict lookup is cheaper than matching the end
+        of every tag.
+
+        Args:
+            root_tag (str): tag of the root element, e.g. {namespace}unimod
+
+        Returns:
+            dict: full tag mapping to local tag name
+        """
+        namespace = root_tag[: root_tag.find("}") + 1]
+        return {f"{namespace}{name}": name for name in xml_tag_names}
+
     def _extract_elements(self, element):
         """Extract xml elements with the name 'element'.
 
         Args:
-            element (xml.etree.ElementTree.Element): xml element
+            element (lxml.etree._Element): xml element
 
         Returns:
             dict: dict mapping symbol to number
         """
         r_dict = {}
-        for sub_element in element.iter():
-            if sub_element.tag.endswith("}element"):
-                number = int(sub_element.attrib["number"])
-                if number != 0:
-                    r_dict[sub_element.attrib["symbol"]] = number
+        for sub_element in element.iter("{*}element"):
+            number = int(sub_element.attrib["number"])
+            if number != 0:
+                # the few element symbols repeat in every composition
+                r_dict[sys.intern(sub_element.attrib["symbol"])] = number
         return r_dict
 
     def _parse_in_more_detail_XML(self):
@@ -356,20 +807,17 @@ class UnimodMapper(object):
             list: list of dicts with information regarding a unimod
         """
         data_list = []
-        for xml_path in self.unimod_xml_names:
-            xml_path = Path(xml_path)
-            if os.path.exists(xml_path) is False:
-                logger.warning(f"{xml_path} does not exist")
-                continue
-
+        for xml_path in self._existing_xml_paths():
             logger.info("Parsing mod xml file ({0})".format(xml_path))
-            unimodXML = ET.iterparse(
-                codecs.open(xml_path, "r", encoding="utf8"),
-                events=(b"start", b"end"),
-            )
+            unimodXML = etree.iterparse(str(xml_path), events=("start", "end"))
+            tags = None
             for event, element in unimodXML:
-                if event == b"start":
-                    if element.tag.endswith("}mod"):
+                if tags is None:
+                    # the first event starts the root element, which sets the namespace
+                    tags = self._xml_tags(element.tag)
+                kind = tags.get(element.tag)
+                if event == "start":
+                    if kind == "mod":
                         tmp = {
                             "Name": element.attrib["title"],
                             "Accession": str(element.attrib.get("record_id", "")),
@@ -381,19 +829,21 @@ class UnimodMapper(object):
                         if element.attrib.get("approved", "0") == "1":
                             tmp["PSI-MS approved"] = True
                             tmp["PSI-MS Name"] = element.attrib["title"]
-                    elif element.tag.endswith("}delta"):
+                    elif kind == "delta":
                         tmp["mono_mass"] = float(element.attrib["mono_mass"])
-                    elif element.tag.endswith("}alt_name"):
-                        tmp["Alt Description"] = element.text
                     else:
                         pass
                 else:
                     # end mod
 
-                    if element.tag.endswith("}delta"):
+                    if kind == "alt_name":
+                        # text is only guaranteed to be parsed on the end event
+                        tmp["Alt Description"] = element.text
+
+                    elif kind == "delta":
                         tmp["elements"] = self._extract_elements(element)
 
-                    elif element.tag.endswith("}specificity"):
+                    elif kind == "specificity":
                         amino_acid = element.attrib["site"]
                         classification = element.attrib["classification"]
                         if classification == "Artefact":
@@ -402,11 +852,8 @@ class UnimodMapper(object):
                         neutral_loss_elements = {}
                         neutral_loss_mass = 0
                         if len(element) > 0:
-                            for sub_element in element.iter():
-                                if (
-                                    sub_element.tag.endswith("}NeutralLoss")
-                                    and len(sub_element) > 0
-                                ):
+                            for sub_element in element.iter("{*}NeutralLoss"):
+                                if len(sub_element) > 0:
 
                                     neutral_loss_elements = self._extract_elements(
                                         sub_element
@@ -418,8 +865,13 @@ class UnimodMapper(object):
                             f"{amino_acid}<|>{classification}<|>{neutral_loss_elements}<|>{neutral_loss_mass}"
                         )
 
-                    elif element.tag.endswith("}mod"):
+                    elif kind == "mod":
                         data_list.append(tmp)
+                        # free the processed mod, so the tree does not grow
+                        # to the size of the whole document
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
                     else:
                         pass
         return data_list
@@ -427,115 +879,233 @@ class UnimodMapper(object):
     def _parseXML(self, xml_file_list=None):
         """Parse unimod xml.
 
+        Args:
+            xml_file_list (list, optional): list of unimod xml files
+
         Returns:
-            list: list of dicts with information regarding a unimod
+            list: list of ModRecords with information regarding a unimod
         """
         if xml_file_list is None:
             xml_file_list = []
         data_list = []
         for xml_file in xml_file_list:
             xml_path = Path(xml_file)
-            if xml_path.exists():
-                logger.debug("Parsing mods file ({0})".format(xml_path))
-                unimodXML = ET.iterparse(
-                    codecs.open(xml_path, "r", encoding="utf8"),
-                    events=(b"start", b"end"),
-                )
-                collect_element = False
-                for event, element in unimodXML:
-                    if event == b"start":
-                        if element.tag.endswith("}mod"):
-                            try:
-                                unimodid = element.attrib["record_id"]
-                            except KeyError:
-                                unimodid = ""
-                            tmp = {
-                                "unimodID": unimodid,
-                                "unimodname": element.attrib["title"],
-                                "element": {},
-                                "specificity": [],
-                                "neutral_loss": [],
-                            }
-                        elif element.tag.endswith("}delta"):
-                            collect_element = True
-                            tmp["mono_mass"] = float(element.attrib["mono_mass"])
-                        elif element.tag.endswith("}element"):
-                            if collect_element is True:
-                                number = int(element.attrib["number"])
-                                if number != 0:
-                                    tmp["element"][element.attrib["symbol"]] = number
-                        elif element.tag.endswith("}specificity"):
-                            amino_acid = element.attrib["site"]
-                            classification = element.attrib["classification"]
-                            if classification != "Artefact":
-                                tmp["specificity"].append((amino_acid, classification))
-                        elif element.tag.endswith("}NeutralLoss"):
-                            if (
-                                element.attrib["composition"]
-                                and element.attrib["composition"] != "0"
-                                and tmp["specificity"]
-                            ):
-                                amino_acid = tmp["specificity"][-1][0]
-                                neutral_loss = element.attrib["mono_mass"]
-                                tmp["neutral_loss"].append((amino_acid, neutral_loss))
-                    else:
-                        # end element
-                        if element.tag.endswith("}delta"):
-                            collect_element = False
-                        elif element.tag.endswith("}mod"):
-                            data_list.append(tmp)
-                        else:
-                            pass
-            else:
-                if xml_path.name == "unimod.xml":
-                    logger.warning(f"No unimod.xml file found. Expected at {xml_path}")
-                    # at least unimod.xml HAS to be available!
-                    print(xml_path)
-                    sys.exit(1)
-                elif xml_path.name == "usermod.xml":
-                    logger.debug(f"No usermod.xml file found. Expected at {xml_path}")
-                    continue
+            logger.debug("Parsing mods file ({0})".format(xml_path))
+            unimodXML = etree.iterparse(str(xml_path), events=("start", "end"))
+            collect_element = False
+            tags = None
+            for event, element in unimodXML:
+                if tags is None:
+                    tags = self._xml_tags(element.tag)
+                kind = tags.get(element.tag)
+                if event == "start":
+                    if kind == "mod":
+                        try:
+                            unimodid = element.attrib["record_id"]
+                        except KeyError:
+                            unimodid = ""
+                        tmp = ModRecord(unimodid, element.attrib["title"])
+                    elif kind == "delta":
+                        collect_element = True
+                        tmp.mono_mass = float(element.attrib["mono_mass"])
+                    elif kind == "element":
+                        if collect_element is True:
+                            number = int(element.attrib["number"])
+                            if number != 0:
+                                symbol = sys.intern(element.attrib["symbol"])
+                                tmp.element[symbol] = number
+                    elif kind == "specificity":
+                        # sites and classifications come from a small
+                        # vocabulary, share one string object each
+                        amino_acid = sys.intern(element.attrib["site"])
+                        classification = sys.intern(element.attrib["classification"])
+                        if classification != "Artefact":
+                            tmp.specificity.append((amino_acid, classification))
+                    elif kind == "NeutralLoss":
+                        if (
+                            element.attrib["composition"]
+                            and element.attrib["composition"] != "0"
+                            and tmp.specificity
+                        ):
+                            amino_acid = tmp.specificity[-1][0]
+                            neutral_loss = float(element.attrib["mono_mass"])
+                            tmp.neutral_loss.append((amino_acid, neutral_loss))
                 else:
-                    logger.warning(f"Specified file not found. Expected at {xml_path}")
-                    sys.exit(1)
+                    # end element
+                    if kind == "delta":
+                        collect_element = False
+                    elif kind == "mod":
+                        data_list.append(tmp)
+                        # free the processed mod, see _parse_in_more_detail_XML
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
+                    else:
+                        pass
         return data_list
 
     def _initialize_mapper(self):
-        """Set up the mapper and generate the index dict."""
-        mapper = {}
-        for index, unimod_data_dict in enumerate(self.data_list):
-            if unimod_data_dict["unimodname"] in mapper.keys():
-                name = unimod_data_dict["unimodname"]
-                id = unimod_data_dict["unimodID"]
-                logger.warning(f"Warning: unimod {name} (ID {id}) is duplicated")
-
-            for key, value in unimod_data_dict.items():
-                if key == "element":
-                    MAJORS = ["C", "H"]
-                    hill_notation = ""
-                    for major in MAJORS:
-                        if major in unimod_data_dict[key].keys():
-                            hill_notation += "{0}({1})".format(
-                                major, unimod_data_dict[key][major]
-                            )
-                    for symbol, number in sorted(unimod_data_dict[key].items()):
-                        if symbol in MAJORS:
-                            continue
-                        hill_notation += "{0}({1})".format(symbol, number)
+        """Set up the mapper, merging the index dicts of all kinds of keys.
 
-                    if hill_notation not in mapper.keys():
-                        mapper[hill_notation] = []
-                    mapper[hill_notation].append(index)
-                elif key == "specificity":
-                    pass
-                elif key == "neutral_loss":
-                    pass
+        Returns:
+            dict: key mapping to a list of data_list indices
+        """
+        mapper = {}
+        for kind in ("id", "name", "composition", "mass"):
+            for key, indices in self._index(kind).items():
+                if key in mapper:
+                    # e.g. a name that is also an id
+                    mapper[key] = sorted(mapper[key] + list(self._as_indices(indices)))
                 else:
-                    if value not in mapper.keys():
-                        mapper[value] = []
-                    mapper[value].append(index)
+                    mapper[key] = list(self._as_indices(indices))
         return mapper
 
+    def _composition_key(self, composition):
+        """Convert a composition into the key it is indexed by in the mapper.
+
+        Args:
+            composition (dict|str): element composition or its Hill notation
+
+        Returns:
+            frozenset|str: hashable mapper key
+        """
+        if isinstance(composition, dict):
+            return frozenset(composition.items())
+        return composition
+
+    def _index(self, kind):
+        """Get the index dict for one kind of key, built on first use.
+
+        Args:
+            kind (str): "name", "id", "mass" or "composition"
+
+        Returns:
+            dict: key mapping to a data_list index, or a list of indices if
+                several entries share the key, see _as_indices
+        """
+        if kind not in self._indices:
+            index = {}
+            for i, entry in enumerate(self.data_list):
+                keys = self._index_keys(kind, entry)
+                if kind == "name" and keys and keys[0] in index:
+                    name = keys[0]
+                    id = entry.unimodID
+                    logger.warning(f"Warning: unimod {name} (ID {id}) is duplicated")
+                for key in keys:
+                    self._add_to_index(index, key, i)
+            self._indices[kind] = index
+        return self._indices[kind]
+
+    def _add_to_index(self, index, key, i):
+        """Add a data_list index to an index dict.
+
+        Most keys belong to a single entry, so a bare int is stored until a
+        second entry shares the key, instead of a list per key.
+
+        Args:
+            index (dict): index dict, see _index
+            key: key of the entry
+            i (int): index of the entry in data_list
+        """
+        indices = index.get(key)
+        if indices is None:
+            index[key] = i
+        elif isinstance(indices, int):
+            index[key] = [indices, i]
+        else:
+            indices.append(i)
+
+    def _as_indices(self, indices):
+        """Get the data_list indices stored for a key in an index dict.
+
+        Args:
+            indices (int|list): value of an index dict, see _add_to_index
+
+        Returns:
+            tuple|list: data_list indices
+        """
+        if isinstance(indices, int):
+            return (indices,)
+        return indices
+
+    def _index_keys(self, kind, entry):
+        """Get the keys a data_list entry is indexed by.
+
+        Args:
+            kind (str): kind of index, see _index
+            entry (ModRecord): parsed unimod entry
+
+        Returns:
+            list: keys of the entry
+        """
+        if kind == "composition":
+            return [self._hill_notation(entry.element), frozenset(entry.element.items())]
+        value = getattr(entry, index_fields[kind], None)
+        if value is None:
+            return []
+        return [value]
+
+    def _indent_xml(self, element, level=0):
+        """Indent an element tree in place, one tab per level.
+
+        Args:
+            element (xml.etree.ElementTree.Element): element to indent
+            level (int): nesting level of element
+        """
+        indent = "\n" + "\t" * level
+        if len(element) > 0:
+            element.text = indent + "\t"
+            for child in element:
+                self._indent_xml(child, level=level + 1)
+                child.tail = indent + "\t"
+            child.tail = indent
+        if level == 0:
+            element.tail = "\n"
+
+    def _add_record(self, entry):
+        """Append an entry to data_list and to the indexes built so far.
+
+        Args:
+            entry (ModRecord): unimod entry
+        """
+        index = len(self.data_list)
+        self.data_list.append(entry)
+        for kind, kind_index in self._indices.items():
+            for key in self._index_keys(kind, entry):
+                self._add_to_index(kind_index, key, index)
+        self._mapper = None
+        self._mass_arr = None
+        self._mass_order = None
+        self._sorted_masses = None
+        self._map_mods_cache = OrderedDict()
+
+    def _hill_notation(self, element):
+        """Convert a composition into unimod style Hill notation.
+
+        Args:
+            element (dict): composition mapping symbol to number
+
+        Returns:
+            str: Hill notation, e.g. C(2)H(3)N(1)O(1)
+        """
+        parts = []
+        majors = 0
+        for major in hill_majors:
+            if major in element:
+                parts.append(f"{major}({element[major]})")
+                majors += 1
+        if majors == len(element):
+            # nothing but majors, e.g. H(2), nothing left to sort
+            return "".join(parts)
+        items = element.items()
+        if len(element) > 1:
+            items = sorted(items)
+        for symbol, number in items:
+            if symbol in hill_majors:
+                continue
+            parts.append(f"{symbol}({number})")
+        return "".join(parts)
+
     # name 2 ....
     @deprecated
     def name2mass_list(self, unimod_name):
@@ -548,12 +1118,7 @@ class UnimodMapper(object):
         Returns:
             list: list of Unimod mono isotopic masses
         """
-        list_2_return = []
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "mono_mass"))
-        return list_2_return
+        return self._values("name", unimod_name, "mono_mass")
 
     @deprecated
     def name2first_mass(self, unimod_name):
@@ -566,13 +1131,7 @@ class UnimodMapper(object):
         Returns:
             float: Unimod mono isotopic mass
         """
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "mono_mass")
-        else:
-            rval = None
-        return rval
+        return self._first("name", unimod_name, "mono_mass")
 
     @deprecated
     def name2composition_list(self, unimod_name):
@@ -585,12 +1144,7 @@ class UnimodMapper(object):
         Returns:
             list: list of Unimod compositions
         """
-        list_2_return = []
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "element"))
-        return list_2_return
+        return self._values("name", unimod_name, "element")
 
     @deprecated
     def name2first_composition(self, unimod_name):
@@ -603,13 +1157,7 @@ class UnimodMapper(object):
         Returns:
             list: list of tuples (specificity sites, classification)Unimod mono isotopic mass
         """
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "element")
-        else:
-            rval = None
-        return rval
+        return self._first("name", unimod_name, "element")
 
     @deprecated
     def name2id_list(self, unimod_name):
@@ -622,12 +1170,7 @@ class UnimodMapper(object):
         Returns:
             list: list of Unimod mono isotopic masses
         """
-        list_2_return = []
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "unimodID"))
-        return list_2_return
+        return self._values("name", unimod_name, "unimodID")
 
     @deprecated
     def name2first_id(self, unimod_name):
@@ -640,13 +1183,7 @@ class UnimodMapper(object):
         Returns:
             float: Unimod mono isotopic mass
         """
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "unimodID")
-        else:
-            rval = None
-        return rval
+        return self._first("name", unimod_name, "unimodID")
 
     @deprecated
     def name2neutral_loss_list(self, unimod_name):
@@ -659,12 +1196,7 @@ class UnimodMapper(object):
         Returns:
             list: list of Unimod mono isotopic masses
         """
-        list_2_return = []
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "neutral_loss"))
-        return list_2_return
+        return self._values("name", unimod_name, "neutral_loss")
 
     @deprecated
     def name2specificity_list(self, unimod_name):
@@ -678,13 +1210,7 @@ class UnimodMapper(object):
         Returns:
             list: list of tuples (specificity sites, classification)
         """
-        list_2_return = []
-        index_list = self.mapper.get(unimod_name, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "specificity"))
-
-        return list_2_return
+        return self._values("name", unimod_name, "specificity")
 
     # unimodid 2 ....
     @deprecated
@@ -698,14 +1224,7 @@ class UnimodMapper(object):
         Returns:
             float: Unimod mono isotopic mass
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        list_2_return = []
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "mono_mass"))
-        return list_2_return
+        return self._values("id", unimod_id, "mono_mass")
 
     @deprecated
     def id2first_mass(self, unimod_id):
@@ -718,15 +1237,7 @@ class UnimodMapper(object):
         Returns:
             float: Unimod mono isotopic mass
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "mono_mass")
-        else:
-            rval = None
-        return rval
+        return self._first("id", unimod_id, "mono_mass")
 
     @deprecated
     def id2composition_list(self, unimod_id):
@@ -739,14 +1250,7 @@ class UnimodMapper(object):
         Returns:
             dict: Unimod elemental composition
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        list_2_return = []
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "element"))
-        return list_2_return
+        return self._values("id", unimod_id, "element")
 
     @deprecated
     def id2first_composition(self, unimod_id):
@@ -759,15 +1263,7 @@ class UnimodMapper(object):
         Returns:
             dict: Unimod composition
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "element")
-        else:
-            rval = None
-        return rval
+        return self._first("id", unimod_id, "element")
 
     @deprecated
     def id2name_list(self, unimod_id):
@@ -780,14 +1276,7 @@ class UnimodMapper(object):
         Returns:
             str: Unimod name
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        list_2_return = []
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "unimodname"))
-        return list_2_return
+        return self._values("id", unimod_id, "unimodname")
 
     @deprecated
     def id2first_name(self, unimod_id):
@@ -800,15 +1289,7 @@ class UnimodMapper(object):
         Returns:
             dict: Unimod composition
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            index = min(index_list)
-            rval = self._data_list_2_value(index, "unimodname")
-        else:
-            rval = None
-        return rval
+        return self._first("id", unimod_id, "unimodname")
 
     @deprecated
     def id2neutral_loss_list(self, unimod_id):
@@ -821,14 +1302,7 @@ class UnimodMapper(object):
         Returns:
             list: list of Unimod mono isotopic masses
         """
-        if isinstance(unimod_id, int) is True:
-            unimod_id = str(unimod_id)
-        list_2_return = []
-        index_list = self.mapper.get(unimod_id, None)
-        if index_list is not None:
-            for index in index_list:
-                list_2_return.append(self._data_list_2_value(index, "neutral_loss"))
-        return list_2_return
+        return self._values("id", unimod_id, "neutral_loss")
 
     # mass is ambigous therefore a list is returned
     @deprecated
@@ -844,7 +1318,7 @@ class UnimodMapper(object):
             list: Unimod names
         """
         list_2_return = []
-        for index in self.mapper[mass]:
+        for index in self._as_indices(self._index("mass")[mass]):
             list_2_return.append(self._data_list_2_value(index, "unimodname"))
         return list_2_return
 
@@ -861,9 +1335,9 @@ class UnimodMapper(object):
             list: Unimod IDs
         """
         list_2_return = []
-        index_list = self.mapper.get(mass, None)
+        index_list = self._index("mass").get(mass, None)
         if index_list is not None:
-            for index in index_list:
+            for index in self._as_indices(index_list):
                 list_2_return.append(self._data_list_2_value(index, "unimodID"))
         return list_2_return
 
@@ -881,7 +1355,7 @@ class UnimodMapper(object):
         """
 
         list_2_return = []
-        for index in self.mapper[mass]:
+        for index in self._as_indices(self._index("mass")[mass]):
             list_2_return.append(self._data_list_2_value(index, "element"))
         return list_2_return
 
@@ -979,15 +1453,18 @@ class UnimodMapper(object):
         since a given composition can map to mutiple entries in the XML.
 
         Args:
-            composition (dict): element composition (element, count pairs)
+            composition (dict|str): element composition (element, count pairs)
+                or its Hill notation
 
         Returns:
             list: Unimod names
         """
         list_2_return = []
-        index_list = self.mapper.get(composition, None)
+        index_list = self._index("composition").get(
+            self._composition_key(composition), None
+        )
         if index_list is not None:
-            for index in index_list:
+            for index in self._as_indices(index_list):
                 value = self._data_list_2_value(index, "unimodname")
                 list_2_return.append(value)
         return list_2_return
@@ -999,15 +1476,18 @@ class UnimodMapper(object):
         since a given composition can map to mutiple entries in the XML.
 
         Args:
-            composition (dict): element composition (element, count pairs)
+            composition (dict|str): element composition (element, count pairs)
+                or its Hill notation
 
         Returns:
             list: Unimod IDs
         """
         list_2_return = []
-        index_list = self.mapper.get(composition, None)
+        index_list = self._index("composition").get(
+            self._composition_key(composition), None
+        )
         if index_list is not None:
-            for index in index_list:
+            for index in self._as_indices(index_list):
                 value = self._data_list_2_value(index, "unimodID")
                 list_2_return.append(value)
         return list_2_return
@@ -1018,16 +1498,19 @@ class UnimodMapper(object):
         Converts unimod composition to unimod monoisotopic mass.
 
         Args:
-            composition (dict): element composition (element, count pairs)
+            composition (dict|str): element composition (element, count pairs)
+                or its Hill notation
 
         Returns:
             float: monoisotopic mass
         """
         mass_2_return = None
         list_2_return = []
-        index_list = self.mapper.get(composition, None)
+        index_list = self._index("composition").get(
+            self._composition_key(composition), None
+        )
         if index_list != None:
-            for index in index_list:
+            for index in self._as_indices(index_list):
                 list_2_return.append(self._data_list_2_value(index, "mono_mass"))
             assert (
                 len(set(list_2_return)) == 1
@@ -1042,13 +1525,28 @@ class UnimodMapper(object):
 
     @deprecated
     def _appMass2whatever(self, mass, decimal_places=2, entry_key=None):
-        return_list = []
-        for entry in self.data_list:
-            umass = entry["mono_mass"]
-            rounded_umass = round(float(umass), decimal_places)
-            if abs(rounded_umass - mass) <= sys.float_info.epsilon:
-                return_list.append(entry[entry_key])
-        return return_list
+        if self._mass_order is None:
+            self._mass_arr = np.fromiter(
+                (getattr(entry, "mono_mass", np.nan) for entry in self.data_list),
+                dtype=np.float64,
+                count=len(self.data_list),
+            )
+            self._mass_order = np.argsort(self._mass_arr, kind="stable")
+            self._sorted_masses = self._mass_arr[self._mass_order]
+        # np.round like the masses below, built-in round may differ on halfway values
+        rounded_mass = np.round(mass, decimal_places)
+        # binary search all masses that could round to rounded_mass, the window is
+        # slightly wider than half a step, so no candidate is lost to float errors
+        window = 0.51 * 10.0 ** -decimal_places
+        sorted_masses = self._sorted_masses
+        lower_index = np.searchsorted(sorted_masses, rounded_mass - window, "left")
+        upper_index = np.searchsorted(sorted_masses, rounded_mass + window, "right")
+        candidates = np.sort(self._mass_order[lower_index:upper_index])
+        matches = np.round(self._mass_arr[candidates], decimal_places) == rounded_mass
+        return [
+            self._data_list_2_value(index, entry_key)
+            for index in candidates[matches].tolist()
+        ]
 
     @deprecated
     def _map_key_2_index_2_value(self, map_key, return_key):
@@ -1063,8 +1561,45 @@ class UnimodMapper(object):
             return_value = self._data_list_2_value(index[0], return_key)
         return return_value
 
+    def _values(self, kind, key, return_key):
+        """Get a value of every data_list entry indexed by a key.
+
+        Args:
+            kind (str): kind of index, see _index
+            key (str|int): key to look up, int ids are converted to str
+            return_key (str): ModRecord field to return
+
+        Returns:
+            list: values of the matching entries in data_list order
+        """
+        if isinstance(key, int):
+            key = str(key)
+        data_list = self.data_list
+        return [
+            getattr(data_list[index], return_key)
+            for index in self._as_indices(self._index(kind).get(key, ()))
+        ]
+
+    def _first(self, kind, key, return_key):
+        """Get a value of the first data_list entry indexed by a key.
+
+        Args:
+            kind (str): kind of index, see _index
+            key (str|int|float): key to look up, int ids are converted to str
+            return_key (str): ModRecord field to return
+
+        Returns:
+            value of the first matching entry or None if the key is not indexed
+        """
+        if isinstance(key, int):
+            key = str(key)
+        index_list = self._index(kind).get(key)
+        if index_list is None:
+            return None
+        return self._data_list_2_value(self._as_indices(index_list)[0], return_key)
+
     def _data_list_2_value(self, index, return_key):
-        return self.data_list[index][return_key]
+        return getattr(self.data_list[index], return_key)
 
     def writeXML(self, modification_dict, xml_file=None):
         """
@@ -1084,16 +1619,27 @@ class UnimodMapper(object):
         unimod = ET.Element("{usermod}unimod")
         modifications = ET.SubElement(unimod, "{usermod}modifications")
         mod_dicts = [modification_dict]
+        # entries of the file this mapper has not read or written yet
+        new_entries = []
+        known = self._xml_entries.setdefault(xml_file.resolve(), set())
+        # parse the files of this mapper before xml_file changes
+        self.data_list
         if xml_file.exists():
             data_list = self._parseXML(xml_file_list=[xml_file])
+            if not known and self._is_xml_path(xml_file):
+                # data_list holds the entries the file had when it was parsed
+                known.update((entry.unimodID, entry.unimodname) for entry in data_list)
             for data_dict in data_list:
                 mod_dict = {
-                    "mass": data_dict["mono_mass"],
-                    "name": data_dict["unimodname"],
-                    "composition": data_dict["element"],
-                    "id": data_dict["unimodID"],
+                    "mass": data_dict.mono_mass,
+                    "name": data_dict.unimodname,
+                    "composition": data_dict.element,
+                    "id": data_dict.unimodID,
                 }
                 mod_dicts.insert(-1, mod_dict)
+                if (data_dict.unimodID, data_dict.unimodname) not in known:
+                    new_entries.append(data_dict)
+                    known.add((data_dict.unimodID, data_dict.unimodname))
 
         for modification_dict in mod_dicts:
             if modification_dict.get("id", None) == None:
@@ -1113,22 +1659,46 @@ class UnimodMapper(object):
                     delta, "{usermod}element", symbol=symbol, number=str(number)
                 )
 
+        self._indent_xml(unimod)
         tree = ET.ElementTree(unimod)
-        tree.write(str(xml_file), encoding="utf-8")
-        xml = xmldom.parse(str(xml_file))
-        pretty_xml_as_string = xml.toprettyxml()
-        with open(xml_file, "w") as outfile:
-            print(pretty_xml_as_string, file=outfile)
-        xml_list = [
-            Path(__file__).parent / xml_name for xml_name in self.unimod_xml_names
-        ]
-        xml_list.append(xml_file)
-        self._reparseXML(xml_file_list=xml_list)
+        tree.write(str(xml_file), encoding="utf-8", xml_declaration=True)
+
+        # mirror the written file in memory instead of parsing it again
+        new_entries.append(
+            ModRecord(
+                modification_dict["id"],
+                modification_dict["name"],
+                element={
+                    symbol: int(number)
+                    for symbol, number in modification_dict["composition"].items()
+                    if int(number) != 0
+                },
+                mono_mass=float(modification_dict["mass"]),
+            )
+        )
+        known.add((modification_dict["id"], modification_dict["name"]))
+        for entry in new_entries:
+            self._add_record(entry)
+        if self._is_xml_path(xml_file):
+            # the df is parsed again with the written file on next use
+            self._df = None
+            self._df_indices = {}
+            self._id_table = None
+            self._sorted_names = None
+            self._combos = {}
         return
 
-    def _reparseXML(self, xml_file_list=[]):
-        self._data_list = self._parseXML(xml_file_list=xml_file_list)
-        self._mapper = self._initialize_mapper()
+    def _is_xml_path(self, xml_file):
+        """Check if an xml file is one of the files this mapper parses.
+
+        Args:
+            xml_file (Path): xml file
+
+        Returns:
+            bool: True if xml_file is one of the files of this mapper
+        """
+        xml_file = xml_file.resolve()
+        return any(xml_path.resolve() == xml_file for xml_path in self._xml_paths)
 
     def map_mods(self, mod_list):
         """
@@ -1143,7 +1713,8 @@ class UnimodMapper(object):
 
         Returns:
             rdict (dict): dict with mod types as keys and corresponding lists of
-                             mod dicts mapped to unimod
+                             mod dicts mapped to unimod. "_id" is the index of the
+                             mod in mod_list and "org" is that mod itself (no copy)
 
         Examples:
 
@@ -1159,8 +1730,119 @@ class UnimodMapper(object):
             ]
 
         """
+        for mod in mod_list:
+            # - User input could be int or string, but has to be converted to string
+            #   internally as map_mods output returns a string unimod_id!
+            # - Has to happen here as mod will be written into mod_dict["org"]
+            #   and is part of the cache key
+            # - Thus, the user is more flexible, but the check will still work.
+            if isinstance(mod.get("id", None), int):
+                mod["id"] = str(mod["id"])
+
+        try:
+            # the value types are part of the key, since e.g. 0, 0.0 and False
+            # are equal but are returned as given
+            key = tuple(
+                tuple((name, type(value), value) for name, value in sorted(mod.items()))
+                for mod in mod_list
+            )
+            hash(key)
+        except TypeError:
+            # mods with unhashable values cannot be cached
+            return self._map_mods(mod_list)
+        if key in self._map_mods_cache:
+            self._map_mods_cache.move_to_end(key)
+            cached, warnings = self._map_mods_cache[key]
+            # repeat the warnings of the mapping, e.g. about unknown mods
+            for warning in warnings:
+                logger.warning(warning)
+        else:
+            messages = []
+            sink_id = logger.add(messages.append, level="WARNING", filter=__name__)
+            try:
+                cached = self._map_mods(mod_list)
+            finally:
+                logger.remove(sink_id)
+            warnings = [message.record["message"] for message in messages]
+            # "org" is re-attached via "_id" on every call, so the cache does not
+            # keep the mods of the first caller alive
+            for mod_dicts in cached.values():
+                for mod_dict in mod_dicts:
+                    mod_dict["org"] = None
+            self._map_mods_cache[key] = (cached, warnings)
+            if len(self._map_mods_cache) > map_mods_cache_size:
+                self._map_mods_cache.popitem(last=False)
+
+        # hand out copies, so callers can not alter the cached mod_dicts,
+        # and point "org" to the mods of this call
+        rdict = {}
+        for mod_type, mod_dicts in cached.items():
+            rdict[mod_type] = [
+                dict(mod_dict, org=mod_list[mod_dict["_id"]]) for mod_dict in mod_dicts
+            ]
+        return rdict
+
+    def map_mods_batch(self, aa, type, position, name=None, id=None, neutral_loss=None):
+        """
+        Maps modifications given as parallel sequences instead of a list of mod_dicts,
+        e.g. columns of a table. Entry i of every sequence describes modification i,
+        None entries are left out of the mod_dict. See map_mods for details.
+
+        Args:
+            aa (list): modified amino acids
+            type (list): modification types ("fix" or "opt")
+            position (list): positions of the modifications
+            name (list, optional): unimod PSI-MS names
+            id (list, optional): unimod accessions
+            neutral_loss (list, optional): neutral losses
+
+        Returns:
+            rdict (dict): dict with mod types as keys and corresponding lists of
+                             mod dicts mapped to unimod
+        """
+        columns = {
+            "aa": aa,
+            "type": type,
+            "position": position,
+            "name": name,
+            "id": id,
+            "neutral_loss": neutral_loss,
+        }
+        columns = {
+            key: list(values) for key, values in columns.items() if values is not None
+        }
+        if len({len(values) for values in columns.values()}) > 1:
+            raise ValueError("All modification sequences need to have the same length")
+        mod_list = [
+            {key: value for key, value in zip(columns, values) if value is not None}
+            for values in zip(*columns.values())
+        ]
+        return self.map_mods(mod_list=mod_list)
+
+    def map_mods_many(self, mod_lists):
+        """
+        Maps several mod_lists at once, e.g. of multiple search parameter sets.
+        Identical mod_lists are only mapped once, see map_mods.
+
+        Args:
+            mod_lists (list): list of mod_lists
+
+        Returns:
+            list: list of rdicts, one per mod_list
+        """
+        return [self.map_mods(mod_list=mod_list) for mod_list in mod_lists]
+
+    def _map_mods(self, mod_list):
+        """Map modifications, see map_mods.
+
+        Args:
+            mod_list (list): list of mod_dicts
 
-        rdict = {"fix": [], "opt": []}
+        Returns:
+            rdict (dict): dict with mod types as keys and corresponding lists of
+                             mod dicts mapped to unimod
+        """
+        rdict = {mod_type: [] for mod_type in mod_types}
         for index, mod in enumerate(mod_list):
 
             # Generate a default mod_dict with minimal required keys
@@ -1176,19 +1858,16 @@ class UnimodMapper(object):
                 "neutral_loss": None,
             }
 
-            # - User input could be int or string, but has to be converted to string
-            #   internally as map_mods output returns a string unimod_id!
-            # - Has to happen here as mod will be written into mod_dict["org"]
-            # - Thus, the user is more flexible, but the check will still work.
-            if isinstance(mod.get("id", None), int):
-                mod["id"] = str(mod["id"])
-
             mod_dict.update(mod)
+            # these keys share a handful of values across all mods
+            for key in ("aa", "type", "position"):
+                if isinstance(mod_dict[key], str):
+                    mod_dict[key] = sys.intern(mod_dict[key])
 
             unimod = False
             unimod_id = None
             type = mod_dict["type"]
-            if type not in ["opt", "fix"]:
+            if type not in mod_types:
                 logger.warning(
                     "You selected a modification type, which is not supported. Only 'fix and 'opt' "
                     "modifications are accepted! Please contact the unimod-mapper dev team if you wish your"
@@ -1215,8 +1894,6 @@ class UnimodMapper(object):
                 if mod_dict["name"] is not None:
                     unimod_name = mod_dict["name"]
                     unimod_id = self.name_to_id(unimod_name)
-                    mass = self.name_to_mass(unimod_name)
-                    composition = self.name_to_composition(unimod_name)
                     if unimod_id == []:
                         logger.warning(
                             "'{1}' is not a Unimod modification please change it to a valid PSI-MS Unimod Name or Unimod Accession # or add the chemical composition as hill notation to the mod_dict, e.g: 'composition': 'H-1N1O2'. Continue without modification {0} ".format(
@@ -1224,12 +1901,12 @@ class UnimodMapper(object):
                             )
                         )
                         continue
+                    mass = self.name_to_mass(unimod_name)
+                    composition = self.name_to_composition(unimod_name)
                     unimod = True
                 elif mod_dict["id"] is not None:
                     unimod_id = mod_dict["id"]
                     unimod_name = self.id_to_name(unimod_id)
-                    mass = self.id_to_mass(unimod_id)
-                    composition = self.id_to_composition(unimod_id)
                     if unimod_name == []:
                         logger.warning(
                             "'{1}' is not a Unimod modification please change it to a valid Unimod Accession # or PSI-MS Unimod Name or add the chemical composition as hill notation to the mod_dict, e.g: 'composition': 'H-1N1O2'. Continue without modification {0} ".format(
@@ -1237,6 +1914,8 @@ class UnimodMapper(object):
                             )
                         )
                         continue
+                    mass = self.id_to_mass(unimod_id)
+                    composition = self.id_to_composition(unimod_id)
                     unimod = True
                 else:
                     logger.warning(
@@ -1276,10 +1955,13 @@ class UnimodMapper(object):
 
             neutral_loss = []
             if mod_dict["neutral_loss"] == "unimod":
-
-                for nl_item in self.name_to_neutral_loss(unimod_name):
-                    if nl_item[0] == mod_dict["aa"]:
-                        neutral_loss.append(nl_item[1])
+                # only the rows of the modified amino acid are needed, so use the
+                # (Name, Site) index instead of filtering all sites of the mod
+                names = unimod_name if isinstance(unimod_name, list) else [unimod_name]
+                rows = self._df_rows(
+                    ("Name", "Site"), [(name, mod_dict["aa"]) for name in names]
+                )
+                neutral_loss.extend(self.df["neutral_losses"].iloc[rows].to_list())
             else:
                 neutral_loss.append(mod_dict["neutral_loss"])
 